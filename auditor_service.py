@@ -0,0 +1,330 @@
+import sqlite3
+import pandas as pd
+import json
+import re
+import os
+import socket
+import time
+import uuid
+from openai import OpenAI
+from migrations import migrate
+from rule_hits import split_reason, record_rule_hit
+from rules import Txn, direction_of
+from window_detector import WindowDetector
+
+# ================= CONFIGURATION =================
+# Standalone Agent 1. Run exactly as many copies as you like: only the lease
+# holder audits, the rest stand by and take over if the leader's lease expires.
+DB_PATH = "fraud_detection.db"
+SERVICE_NAME = "auditor"
+CHECK_INTERVAL = 10      # seconds between audit passes
+LEASE_TTL = 30           # leader must renew within this many seconds or lose the lease
+LLM_TIMEOUT = 20         # keep well below LEASE_TTL: the lease is not renewed during the call
+
+GROQ_API_KEY = os.environ.get("GROQ_API_KEY")  # Ensure this is set
+# No client retries: each retry would restart the timeout and outlive the lease
+client = OpenAI(base_url="https://api.groq.com/openai/v1", api_key=GROQ_API_KEY,
+                timeout=LLM_TIMEOUT, max_retries=0)
+
+HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Short-window rules (VELOCITY, SAME-TIME COLLISION, MICRO-PROBING, PASS-THROUGH)
+# are decided per event in-process; the LLM only sees what they did not hold.
+detector = WindowDetector()
+# Window hits whose write failed (e.g. "database is locked"). The detector has
+# already marked those rows as seen, so the next pass re-applies these instead.
+unwritten_holds = {}
+
+# ================= HELPER FUNCTIONS =================
+
+def get_db_connection():
+    try:
+        return sqlite3.connect(DB_PATH, timeout=10)
+    except Exception as e:
+        print(f"[ERROR] DB Connection: {e}")
+        return None
+
+def _renew_lease(conn, service=SERVICE_NAME, holder=HOLDER_ID, ttl=LEASE_TTL):
+    """Lease upsert without committing, so callers can fence other writes in the same transaction."""
+    now = time.time()
+    cur = conn.execute("""
+        INSERT INTO service_leases (service, holder, acquired_at, lease_expires_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(service) DO UPDATE SET
+            acquired_at = CASE WHEN service_leases.holder = excluded.holder
+                               THEN service_leases.acquired_at ELSE excluded.acquired_at END,
+            holder = excluded.holder,
+            lease_expires_at = excluded.lease_expires_at
+        WHERE service_leases.holder = excluded.holder OR service_leases.lease_expires_at < ?
+    """, (service, holder, now, now + ttl, now))
+    return cur.rowcount == 1
+
+def acquire_lease(conn, service=SERVICE_NAME, holder=HOLDER_ID, ttl=LEASE_TTL):
+    """Takes or renews the lease. Succeeds only if we already hold it or the current one has expired."""
+    with conn:
+        return _renew_lease(conn, service, holder, ttl)
+
+def write_as_leader(conn, write):
+    """Runs write(conn) only if we still hold the lease, in one BEGIN IMMEDIATE transaction.
+
+    The lease check and the writes commit together, so no other auditor can take
+    over in between. Returns False (nothing written) if the lease was lost.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not _renew_lease(conn):
+            conn.rollback()
+            return False
+        write(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+    return True
+
+def release_lease(conn, service=SERVICE_NAME, holder=HOLDER_ID):
+    """Expires our lease now so a standby can take over without waiting for the TTL."""
+    with conn:
+        conn.execute(
+            "UPDATE service_leases SET lease_expires_at=? WHERE service=? AND holder=?",
+            (time.time(), service, holder)
+        )
+
+def record_status(conn, pending, approved, held, error=None, service=SERVICE_NAME, holder=HOLDER_ID):
+    with conn:
+        conn.execute("""
+            UPDATE service_leases
+            SET last_run_at=?, last_pending=?, last_approved=?, last_held=?, last_error=?
+            WHERE service=? AND holder=?
+        """, (time.time(), pending, approved, held, error, service, holder))
+
+def approve_txn(conn, tid):
+    # Only Pending rows: a reviewer may have decided on the row while the LLM was thinking
+    conn.execute(
+        """UPDATE Transactions SET transaction_status='Approved', Internal_Flag='Y', note='Passed Automated Audit'
+           WHERE transaction_id=? AND transaction_status='Pending'""",
+        (tid,)
+    )
+
+def hold_window_hits(conn, tid, hits):
+    """Holds a txn flagged by the window detector; the strongest hit becomes the display note."""
+    hits = sorted(hits, key=lambda h: h[1], reverse=True)
+    rule_id, score, summary, evidence = hits[0]
+    if hold_txn(conn, tid, f"[RULE:{rule_id}] {summary}", rule_id, score, evidence):
+        for rule_id, score, summary, evidence in hits[1:]:
+            record_rule_hit(conn, tid, rule_id, summary, score, evidence)
+
+def hold_txn(conn, tid, reason, rule_id=None, score=None, evidence=None):
+    """Puts a txn On Hold and records the structured rule hit alongside the display note."""
+    cur = conn.execute(
+        """UPDATE Transactions SET transaction_status='On Hold', Internal_Flag='N', note=?
+           WHERE transaction_id=? AND transaction_status='Pending'""",
+        (reason, tid)
+    )
+    if cur.rowcount:
+        tagged_rule, summary = split_reason(reason)
+        record_rule_hit(conn, tid, rule_id or tagged_rule, summary, score, evidence)
+    return cur.rowcount
+
+# ================= AUDIT PASS =================
+
+def build_prompt(pending, history):
+    return f"""
+    Act as a Banking Fraud AI. Analyze PENDING transactions against HISTORY.
+    
+   STRICT RULES FOR DETECTION:
+    
+    1. GEO-ANOMALY (Time & Distance Check):
+       - COMPARE the current 'customer_id' transaction against the ENTIRE TRANSACTION HISTORY (Status: Pending, On Hold, Approved).
+       
+       - LOCATION COMPARISON CHECKS:
+         a) Compare current 'transaction_place' against Customer Table 'city_name' (Home City) based on customer_id.
+         b) Compare current 'transaction_country' against Customer Table 'Country' (Home Country) based on customer_id.
+         c) Compare current 'transaction_place' against 'transaction_place' of ALL previous history transactions based on customer_id.
+         d) Compare current 'transaction_country' against 'transaction_country' of ALL previous history transactions based on customer_id.
+         e) compare current 'transaction_date_time' againt 'transaction_date_time' of ALL previous history transactions based on customer_id.
+       - CRITICAL TIME & SAME-SECOND CHECK:
+         a) Compare 'customer_id' against history transactions made by the same customer with the EXACT SAME 'transaction_date_time'. 
+            If date/time is identical (down to the second) but 'transaction_place' is different -> HOLD.
+         b) Different Country: If txn is in a different country than Home or History within <= 36 HOURS -> HOLD.
+         c) Same Country: If txn 'transaction_place' is in a different city than Home or History within <= 1 HOURS -> HOLD.
+         
+    2. SAME-TIME COLLISION (Global & History Check):
+       - COMPARE 'customer_id' against their own HISTORY and other PENDING items.
+       - IF 'transaction_date_time' is EXACTLY the same (down to the second) but 'transaction_place' is different based on customer_id and transaction_place and transaction_date_time -> HOLD.
+       - Logic: "Impossible Simultaneous Travel".
+    
+    3. VELOCITY (High Frequency):
+       - Multiple transactions for same customer within < 60 SECONDS based on customer_id -> HOLD.
+
+    4. STRUCTURING (Smurfing):
+       - Amount between 9,000 and 9,999 based on customer_id and "transaction_date_time" and transaction_date_time "check for history transaction_amount of the customer and "approve" if he made same like trsnsaction early" and Transaction amount-> (HOLD,ACCEPT).
+
+    5. PASS-THROUGH (Mule Account):
+       - Debit txn occurs < 60 mins after a credit txn of similar value based on customer_id and -> HOLD.
+
+    6. DORMANCY WAKE-UP:
+       - No transactions for > 30 days AND current amount > 1000 based on Transaction amount-> HOLD.
+
+    7. MICRO-PROBING:
+       - Small txn (< 5.00) followed immediately by large txn (> 500) based on customer_id andtransaction_date_time, amount-> HOLD.
+
+    OUTPUT REQUIREMENTS:
+    - Return JSON: {{ "safe": ["ID"], "hold": [{{"id": "ID", "rule": "RULE-ID", "score": 0.0-1.0, "reason": "...", "evidence": {{...}}}}] }}
+    - 'score' is your confidence that the rule fired; 'evidence' holds the compared values (times, places, amounts).
+    - **CRITICAL**: Start the 'reason' string with the Rule ID.
+      Example: "[RULE:VELOCITY] 4 transactions detected in 10 seconds."
+      Example: "[RULE:GEO-ANOMALY] Jump from London to NYC in 15 mins."
+    
+    PENDING DATA: {pending.to_dict(orient='records')}
+    HISTORY DATA: {history.to_dict(orient='records')}
+    """
+
+def audit_pass(conn):
+    """One scan of Pending rows. Returns (pending, approved, held), or None if the lease was lost mid-pass."""
+    # 1. Fetch Pending Records
+    pending = pd.read_sql("""
+        SELECT t.*, c.city_name, c.Country as home_country,
+               CAST(STRFTIME('%s', t.transaction_date_time) AS INTEGER) AS ts
+        FROM Transactions t 
+        JOIN Customer c ON t.customer_id=c.customer_id 
+        WHERE t.Internal_Flag='N' AND t.transaction_status='Pending'
+        ORDER BY t.transaction_date_time, t.transaction_id
+    """, conn)
+
+    if pending.empty:
+        return 0, 0, 0
+
+    # 2. Per-event window rules, in arrival order. Each txn is fed to the detector once.
+    retry = {tid: unwritten_holds[tid] for tid in pending.transaction_id if tid in unwritten_holds}
+    unwritten_holds.clear()
+    window_holds = {}
+    for row in pending.itertuples(index=False):
+        txn = Txn(row.transaction_id, row.customer_id, None if pd.isna(row.ts) else int(row.ts),
+                  row.transaction_date_time, row.transaction_place, row.transaction_country,
+                  float(row.amount), direction_of(row.transaction_category, row.transaction_type))
+        hits = detector.process(txn) or retry.get(txn.transaction_id)
+        if hits:
+            window_holds[txn.transaction_id] = hits
+    if window_holds:
+        unwritten_holds.update(window_holds)  # cleared below once written
+        def write_window_holds(conn):
+            for tid, hits in window_holds.items():
+                hold_window_hits(conn, tid, hits)
+
+        # Same fencing as the LLM verdicts; the detector is rebuilt if we regain the lease
+        if not write_as_leader(conn, write_window_holds):
+            return None
+        unwritten_holds.clear()
+        pending = pending[~pending.transaction_id.isin(window_holds)]
+        if pending.empty:
+            return len(window_holds), 0, len(window_holds)
+    pending = pending.drop(columns=["ts"])
+
+    # 3. Fetch History
+    history = pd.read_sql("""
+        SELECT transaction_id, customer_id, transaction_date_time, transaction_place, 
+               transaction_country, amount 
+        FROM Transactions 
+        WHERE Internal_Flag='Y' OR transaction_status IN ('On Hold', 'Declined')
+        ORDER BY transaction_date_time DESC LIMIT 50
+    """, conn)
+
+    res = client.chat.completions.create(
+        model="llama-3.3-70b-versatile", 
+        messages=[
+            {"role": "system", "content": "You are a JSON-only detection engine."}, 
+            {"role": "user", "content": build_prompt(pending, history)}
+        ], 
+        temperature=0
+    )
+    clean_json = re.search(r"\{.*\}", res.choices[0].message.content, re.DOTALL).group()
+    data = json.loads(clean_json)
+
+    safe = data.get("safe", [])
+    holds = []
+    for h in data.get("hold", []):
+        # One malformed verdict must not roll back the batch and stall these rows forever
+        if isinstance(h, dict) and h.get("id") and h.get("reason"):
+            holds.append(h)
+        else:
+            print(f"   ⚠️ Skipping malformed hold verdict: {h!r}")
+
+    def write_verdicts(conn):
+        for tid in safe:
+            approve_txn(conn, tid)
+        for h in holds:
+            hold_txn(conn, h["id"], h["reason"], h.get("rule"), h.get("score"), h.get("evidence"))
+
+    # Fencing: a deposed leader must not write verdicts
+    if not write_as_leader(conn, write_verdicts):
+        return None
+    return len(pending) + len(window_holds), len(safe), len(holds) + len(window_holds)
+
+# ================= MAIN SERVICE LOOP =================
+
+def run_service():
+    global detector
+    print("-------------------------------------------------")
+    print(f"⚖️ SENTINEL AUDITOR SERVICE ({HOLDER_ID})")
+    print("-------------------------------------------------")
+
+    migrate(DB_PATH)
+    leader = False
+
+    try:
+        while True:
+            conn = get_db_connection()
+            if not conn:
+                time.sleep(CHECK_INTERVAL)
+                continue
+
+            try:
+                if acquire_lease(conn):
+                    if not leader:
+                        # Fresh window state: a standby's view is stale by the time it takes over
+                        detector = WindowDetector()
+                        unwritten_holds.clear()
+                        warmed = detector.warm_from_db(conn)
+                        print(f"👑 Lease acquired, auditing. Window detector warmed with {warmed} recent transactions.")
+                    leader = True
+                    try:
+                        result = audit_pass(conn)
+                    except Exception as e:
+                        print(f"Agent Error: {e}")
+                        record_status(conn, None, None, None, str(e))
+                    else:
+                        if result is None:
+                            print("⚠️ Lease lost during pass, verdicts discarded.")
+                            leader = False
+                        else:
+                            record_status(conn, *result)
+                            if result[0]:
+                                print(f"🚨 Audited {result[0]} pending: {result[1]} approved, {result[2]} on hold")
+                            else:
+                                print(f"💤 Monitoring... (Next check in {CHECK_INTERVAL}s)")
+                else:
+                    if leader:
+                        print("⚠️ Lease taken over by another auditor.")
+                    leader = False
+                    current = conn.execute(
+                        "SELECT holder FROM service_leases WHERE service=?", (SERVICE_NAME,)
+                    ).fetchone()
+                    print(f"⏸️ Standby, leader is {current[0] if current else 'unknown'}")
+
+            except Exception as e:
+                print(f"CRITICAL ERROR: {e}")
+
+            finally:
+                conn.close()
+                time.sleep(CHECK_INTERVAL)
+
+    except KeyboardInterrupt:
+        conn = get_db_connection()
+        if conn:
+            release_lease(conn)
+            conn.close()
+        print("👋 Auditor stopped, lease released.")
+
+if __name__ == "__main__":
+    run_service()
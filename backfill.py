@@ -0,0 +1,231 @@
+import sqlite3
+import json
+import time
+import os
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from rules import RULESET_VERSION, CustomerState, Txn, direction_of
+
+# ================= CONFIGURATION =================
+DB_PATH = "fraud_detection.db"          # live database, opened read-only
+LABELS_DB_PATH = "fraud_labels.db"      # backfill output lives in its own file
+CHUNK_SIZE = 5000
+WORKERS = os.cpu_count() or 2
+IN_FLIGHT_PER_WORKER = 2                # chunks held in memory = workers * this
+
+# Rows come out ordered by (customer_id, transaction_date_time, transaction_id)
+STREAM_COLUMNS = """
+    SELECT t.transaction_id, t.customer_id,
+           CAST(STRFTIME('%s', t.transaction_date_time) AS INTEGER) AS ts,
+           t.transaction_date_time, t.transaction_place, t.transaction_country, t.amount,
+           t.transaction_category, t.transaction_type, c.city_name, c.Country
+    FROM Transactions t LEFT JOIN Customer c ON c.customer_id = t.customer_id
+"""
+ORDER_BY = " ORDER BY t.customer_id, t.transaction_date_time, t.transaction_id"
+STREAM_INDEX = "idx_transactions_customer_time"  # created by migration v4; without it every chunk is a full sort
+
+LABELS_DDL = '''
+    CREATE TABLE IF NOT EXISTS backfill_labels (
+        transaction_id TEXT NOT NULL,
+        ruleset TEXT NOT NULL,
+        rule_id TEXT NOT NULL,
+        customer_id INTEGER,
+        transaction_date_time TEXT,
+        score REAL,
+        evidence TEXT,
+        labeled_at TEXT NOT NULL DEFAULT (DATETIME('now')),
+        PRIMARY KEY (transaction_id, ruleset, rule_id));
+
+    CREATE INDEX IF NOT EXISTS idx_backfill_labels_rule_time
+        ON backfill_labels (ruleset, rule_id, transaction_date_time);
+
+    CREATE TABLE IF NOT EXISTS backfill_checkpoint (
+        ruleset TEXT PRIMARY KEY,
+        last_customer_id INTEGER,
+        last_date_time TEXT,
+        last_transaction_id TEXT,
+        rows_done INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT);
+'''
+
+# ================= HELPERS =================
+
+def open_live_readonly(db_path):
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=10)
+
+def has_stream_index(live):
+    return live.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='index' AND name=?", (STREAM_INDEX,)
+    ).fetchone() is not None
+
+def init_labels_db(labels_path):
+    conn = sqlite3.connect(labels_path, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(LABELS_DDL)
+    return conn
+
+def load_checkpoint(labels_conn, ruleset):
+    row = labels_conn.execute(
+        "SELECT last_customer_id, last_date_time, last_transaction_id, rows_done FROM backfill_checkpoint WHERE ruleset=?",
+        (ruleset,)
+    ).fetchone()
+    if not row:
+        return None, 0
+    return (row[0], row[1], row[2]), row[3]
+
+def row_to_txn(row):
+    tid, cust, ts, when, place, country, amount, category, txn_type, home_city, home_country = row
+    return Txn(tid, cust, ts, when, place, country, float(amount or 0), direction_of(category, txn_type),
+               home_city, home_country)
+
+def iter_chunks(live, after_key, chunk_size):
+    """Keyset-paginated stream; each read is a short query so the live DB is never locked for long."""
+    while True:
+        if after_key is None:
+            rows = live.execute(STREAM_COLUMNS + ORDER_BY + " LIMIT ?", (chunk_size,)).fetchall()
+        else:
+            rows = live.execute(
+                STREAM_COLUMNS
+                + " WHERE (t.customer_id, t.transaction_date_time, t.transaction_id) > (?, ?, ?)"
+                + ORDER_BY + " LIMIT ?",
+                (*after_key, chunk_size)
+            ).fetchall()
+        if not rows:
+            return
+        yield rows
+        after_key = (rows[-1][1], rows[-1][3], rows[-1][0])
+
+def rebuild_state(live, key):
+    """On resume: replays the checkpoint customer's rows up to the checkpoint so rule state is intact."""
+    if key is None:
+        return None
+    state = CustomerState(key[0])
+    rows = live.execute(
+        STREAM_COLUMNS
+        + " WHERE t.customer_id = ? AND (t.transaction_date_time, t.transaction_id) <= (?, ?)"
+        + ORDER_BY,
+        key
+    )
+    for row in rows:
+        if row[2] is not None:
+            state.observe(row_to_txn(row))
+    return state
+
+def advance_state(state, rows):
+    """Main-process bookkeeping: state of the chunk's last customer, ready to seed the next chunk."""
+    last_cust = rows[-1][1]
+    start = len(rows) - 1
+    while start > 0 and rows[start - 1][1] == last_cust:
+        start -= 1
+    if start > 0 or state is None or state.customer_id != last_cust:
+        state = CustomerState(last_cust)
+    for row in rows[start:]:
+        if row[2] is not None:
+            state.observe(row_to_txn(row))
+    return state
+
+# ================= WORKER =================
+
+def score_chunk(rows, seed):
+    """Runs the rules over one chunk. `seed` carries the first customer's state from the previous chunk."""
+    labels = []
+    state = seed
+    for row in rows:
+        if row[2] is None:
+            continue  # unparseable timestamp
+        txn = row_to_txn(row)
+        if state is None or state.customer_id != txn.customer_id:
+            state = CustomerState(txn.customer_id)
+        for rule_id, score, summary, evidence in state.process(txn):
+            evidence["summary"] = summary
+            labels.append((txn.transaction_id, RULESET_VERSION, rule_id, txn.customer_id, txn.when,
+                           score, json.dumps(evidence, default=str)))
+    return labels
+
+def commit_chunk(labels_conn, labels, last_key, rows_done):
+    """Labels and checkpoint go in one transaction so a resume never double-counts or skips a chunk."""
+    with labels_conn:
+        labels_conn.executemany(
+            """INSERT OR REPLACE INTO backfill_labels
+               (transaction_id, ruleset, rule_id, customer_id, transaction_date_time, score, evidence)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            labels
+        )
+        labels_conn.execute(
+            """INSERT OR REPLACE INTO backfill_checkpoint
+               (ruleset, last_customer_id, last_date_time, last_transaction_id, rows_done, updated_at)
+               VALUES (?, ?, ?, ?, ?, DATETIME('now'))""",
+            (RULESET_VERSION, *last_key, rows_done)
+        )
+
+# ================= MAIN =================
+
+def run_backfill(db_path=DB_PATH, labels_path=LABELS_DB_PATH, chunk_size=CHUNK_SIZE, workers=WORKERS, reset=False):
+    print("-------------------------------------------------")
+    print(f"📚 SENTINEL BACKFILL (ruleset {RULESET_VERSION})")
+    print("-------------------------------------------------")
+
+    # The live DB is opened read-only; schema changes belong to migrations.py, not here
+    live = open_live_readonly(db_path)
+    if not has_stream_index(live):
+        live.close()
+        print(f"❌ {db_path} has no {STREAM_INDEX} index, so keyset paging would re-sort Transactions on every chunk.")
+        print(f"   Run the migrations first: python -c \"from migrations import migrate; migrate('{db_path}')\"")
+        raise SystemExit(1)
+
+    labels_conn = init_labels_db(labels_path)
+    if reset:
+        with labels_conn:
+            labels_conn.execute("DELETE FROM backfill_checkpoint WHERE ruleset=?", (RULESET_VERSION,))
+            labels_conn.execute("DELETE FROM backfill_labels WHERE ruleset=?", (RULESET_VERSION,))
+
+    after_key, rows_done = load_checkpoint(labels_conn, RULESET_VERSION)
+    if after_key:
+        print(f"↩️ Resuming after customer {after_key[0]} @ {after_key[1]} ({rows_done} rows already scored)")
+    state = rebuild_state(live, after_key)
+
+    started = time.time()
+    session_rows = 0
+    total_hits = 0
+    in_flight = deque()
+
+    def drain_one():
+        nonlocal rows_done, session_rows, total_hits
+        future, last_key, n_rows = in_flight.popleft()
+        labels = future.result()
+        rows_done += n_rows
+        session_rows += n_rows
+        total_hits += len(labels)
+        commit_chunk(labels_conn, labels, last_key, rows_done)
+        rate = session_rows / max(time.time() - started, 1e-6)
+        print(f"   ✅ {rows_done:,} rows scored | {total_hits:,} hits | {rate:,.0f} rows/s")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for rows in iter_chunks(live, after_key, chunk_size):
+            seed = state if state is not None and state.customer_id == rows[0][1] else None
+            # Seed is pickled lazily by the pool, so hand over a copy before advancing
+            future = pool.submit(score_chunk, rows, seed.copy() if seed else None)
+            state = advance_state(state, rows)
+            in_flight.append((future, (rows[-1][1], rows[-1][3], rows[-1][0]), len(rows)))
+            while len(in_flight) >= workers * IN_FLIGHT_PER_WORKER:
+                drain_one()
+        while in_flight:
+            drain_one()
+
+    live.close()
+    labels_conn.close()
+    elapsed = time.time() - started
+    print(f"🏁 Backfill complete: {session_rows:,} rows in {elapsed:,.1f}s "
+          f"({session_rows / max(elapsed, 1e-6):,.0f} rows/s), {total_hits:,} hits")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score the full Transactions history with the current rules.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--labels-db", default=LABELS_DB_PATH)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--reset", action="store_true", help="discard the checkpoint and labels for this ruleset")
+    args = parser.parse_args()
+    run_backfill(args.db, args.labels_db, args.chunk_size, args.workers, args.reset)
@@ -3,6 +3,7 @@ import pandas as pd
 import time
 import os
 from openai import OpenAI
+from migrations import migrate
 
 # ================= CONFIGURATION =================
 # 1. API KEY
@@ -62,6 +63,9 @@ def run_agent():
     print("-------------------------------------------------")
     print("🤖 SENTINEL AGENT 2 (CLEAN FORMAT) IS ONLINE")
     print("-------------------------------------------------")
+
+    # rule_hits must exist before the alert query joins it
+    migrate(DB_PATH)
     
     while True:
         conn = get_db_connection()
@@ -73,6 +77,8 @@ def run_agent():
             # 1. Fetch Pending Alerts
             query = """
                 SELECT t.transaction_id, t.amount, t.currency, t.transaction_date_time, t.transaction_place, t.note,
+                       (SELECT GROUP_CONCAT(JSON_EXTRACT(h.evidence, '$.summary'), '; ')
+                          FROM rule_hits h WHERE h.transaction_id = t.transaction_id) AS issue,
                        c.customer_id, c.customer_name, c.email_id as cust_email,
                        rm.rm_name
                 FROM Transactions t
@@ -106,12 +112,8 @@ def run_agent():
                     for _, row in group.iterrows():
                         txn_ids.append(row['transaction_id'])
                         
-                        # CLEAN THE NOTE: Remove [RULE:XXX] if it exists
-                        raw_note = str(row['note'])
-                        if "]" in raw_note:
-                            clean_note = raw_note.split("]")[-1].strip() # Takes part after ']'
-                        else:
-                            clean_note = raw_note
+                        # Rule summaries come pre-split from rule_hits; untagged manual notes fall back to the raw note
+                        clean_note = row['issue'] if row['issue'] else str(row['note'])
                         
                         clean_notes.add(clean_note)
 
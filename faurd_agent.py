@@ -1,36 +1,46 @@
 import streamlit as st
 import sqlite3
 import pandas as pd
-import json
-import re
-from openai import OpenAI
+import time
+from migrations import migrate
+from llm_stream import stream_completion, continuation_messages
 
 # ================= CONFIG =================
 st.set_page_config(layout="wide", page_title="Sentinel FRAUD Auditor", page_icon="⚖️")
 
 # API Configuration - Replace with your key
 GROQ_API_KEY =  # Ensure this is set
-client = OpenAI(base_url="https://api.groq.com/openai/v1", api_key=GROQ_API_KEY)
+DB_PATH = "fraud_detection.db"
 
 # Persistent State
 if "selected_tid" not in st.session_state: st.session_state.selected_tid = None
 if "forensic_report" not in st.session_state: st.session_state.forensic_report = ""
+if "forensic_done" not in st.session_state: st.session_state.forensic_done = False
+if "email_draft" not in st.session_state: st.session_state.email_draft = {}
+
+# ================= CACHED RESOURCES =================
+# Streamlit reruns this script on every click; these are built once per process.
+@st.cache_resource
+def get_llm_client():
+    from openai import OpenAI
+    return OpenAI(base_url="https://api.groq.com/openai/v1", api_key=GROQ_API_KEY)
+
+@st.cache_resource
+def ensure_schema():
+    """Schema migrations run once per process (see migrations.py)."""
+    migrate(DB_PATH)
+    return DB_PATH
 
 # ================= DATABASE HELPERS =================
 def get_db_connection():
-    return sqlite3.connect("fraud_detection.db", check_same_thread=False)
-
-def check_schema_update():
-    """Ensures the 'note' column exists for saving reasons."""
-    conn = get_db_connection()
-    try:
-        conn.execute("ALTER TABLE Transactions ADD COLUMN note TEXT")
-    except sqlite3.OperationalError:
-        pass # Column likely already exists
-    conn.close()
+    """One connection per browser session, never shared between sessions.
 
-# Run schema check once on startup
-check_schema_update()
+    A session's reruns may land on different script threads, hence
+    check_same_thread=False, but they never run concurrently.
+    """
+    if "db_conn" not in st.session_state:
+        st.session_state.db_conn = sqlite3.connect(ensure_schema(), check_same_thread=False)
+    return st.session_state.db_conn
 
 def update_txn(tid, status, flag, note=None):
     with get_db_connection() as conn:
@@ -88,113 +98,37 @@ def migrate_to_fraud_table(tid, reason, full_report):
                 ))
         except sqlite3.Error as e:
             st.error(f"Database Error during migration: {e}")
-            
-    conn.close()
 
-# ================= AGENT 1: BACKGROUND AUDITOR =================
+# ================= AGENT 1: AUDITOR STATUS =================
+# Auditing runs out of process in auditor_service.py (one leader across all
+# dashboards); the dashboard only reads the leader's lease and last-run status.
 @st.fragment(run_every=10)
-def background_audit_agent():
-    conn = get_db_connection()
-    
-    # 1. Fetch Pending Records
-    pending = pd.read_sql("""
-        SELECT t.*, c.city_name, c.Country as home_country 
-        FROM Transactions t 
-        JOIN Customer c ON t.customer_id=c.customer_id 
-        WHERE t.Internal_Flag='N' AND t.transaction_status='Pending'
-    """, conn)
-    
-    # 2. Fetch History
-    history = pd.read_sql("""
-        SELECT transaction_id, customer_id, transaction_date_time, transaction_place, 
-               transaction_country, amount 
-        FROM Transactions 
-        WHERE Internal_Flag='Y' OR transaction_status IN ('On Hold', 'Declined')
-        ORDER BY transaction_date_time DESC LIMIT 50
-    """, conn)
-    
-    if pending.empty:
-        conn.close()
+def auditor_status_panel():
+    status = pd.read_sql(
+        "SELECT * FROM service_leases WHERE service='auditor'", get_db_connection()
+    )
+    if status.empty:
+        st.warning("Auditor service has never run. Start it with `python auditor_service.py`.", icon="⚠️")
         return
-
-    # Updated Prompt with RULE IDs
-    prompt = f"""
-    Act as a Banking Fraud AI. Analyze PENDING transactions against HISTORY.
-    
-   STRICT RULES FOR DETECTION:
-    
-    1. GEO-ANOMALY (Time & Distance Check):
-       - COMPARE the current 'customer_id' transaction against the ENTIRE TRANSACTION HISTORY (Status: Pending, On Hold, Approved).
-       
-       - LOCATION COMPARISON CHECKS:
-         a) Compare current 'transaction_place' against Customer Table 'city_name' (Home City) based on customer_id.
-         b) Compare current 'transaction_country' against Customer Table 'Country' (Home Country) based on customer_id.
-         c) Compare current 'transaction_place' against 'transaction_place' of ALL previous history transactions based on customer_id.
-         d) Compare current 'transaction_country' against 'transaction_country' of ALL previous history transactions based on customer_id.
-         e) compare current 'transaction_date_time' againt 'transaction_date_time' of ALL previous history transactions based on customer_id.
-       - CRITICAL TIME & SAME-SECOND CHECK:
-         a) Compare 'customer_id' against history transactions made by the same customer with the EXACT SAME 'transaction_date_time'. 
-            If date/time is identical (down to the second) but 'transaction_place' is different -> HOLD.
-         b) Different Country: If txn is in a different country than Home or History within <= 36 HOURS -> HOLD.
-         c) Same Country: If txn 'transaction_place' is in a different city than Home or History within <= 1 HOURS -> HOLD.
-         
-    2. SAME-TIME COLLISION (Global & History Check):
-       - COMPARE 'customer_id' against their own HISTORY and other PENDING items.
-       - IF 'transaction_date_time' is EXACTLY the same (down to the second) but 'transaction_place' is different based on customer_id and transaction_place and transaction_date_time -> HOLD.
-       - Logic: "Impossible Simultaneous Travel".
-    
-    3. VELOCITY (High Frequency):
-       - Multiple transactions for same customer within < 60 SECONDS based on customer_id -> HOLD.
-
-    4. STRUCTURING (Smurfing):
-       - Amount between 9,000 and 9,999 based on customer_id and "transaction_date_time" and transaction_date_time "check for history transaction_amount of the customer and "approve" if he made same like trsnsaction early" and Transaction amount-> (HOLD,ACCEPT).
-
-    5. PASS-THROUGH (Mule Account):
-       - Debit txn occurs < 60 mins after a credit txn of similar value based on customer_id and -> HOLD.
-
-    6. DORMANCY WAKE-UP:
-       - No transactions for > 30 days AND current amount > 1000 based on Transaction amount-> HOLD.
-
-    7. MICRO-PROBING:
-       - Small txn (< 5.00) followed immediately by large txn (> 500) based on customer_id andtransaction_date_time, amount-> HOLD.
-
-    OUTPUT REQUIREMENTS:
-    - Return JSON: {{ "safe": ["ID"], "hold": [{{"id": "ID", "reason": "..."}}] }}
-    - **CRITICAL**: Start the 'reason' string with the Rule ID.
-      Example: "[RULE:VELOCITY] 4 transactions detected in 10 seconds."
-      Example: "[RULE:GEO-ANOMALY] Jump from London to NYC in 15 mins."
-    
-    PENDING DATA: {pending.to_dict(orient='records')}
-    HISTORY DATA: {history.to_dict(orient='records')}
-    """
-    
-    try:
-        res = client.chat.completions.create(
-            model="llama-3.3-70b-versatile", 
-            messages=[
-                {"role": "system", "content": "You are a JSON-only detection engine."}, 
-                {"role": "user", "content": prompt}
-            ], 
-            temperature=0
+    s = status.iloc[0]
+    now = time.time()
+    if s.lease_expires_at < now:
+        st.error(f"Auditor offline since {int(now - s.lease_expires_at)}s (last leader: {s.holder}).", icon="🛑")
+    elif pd.notna(s.last_error):
+        st.warning(f"Auditor {s.holder} online, last pass failed: {s.last_error}", icon="⚠️")
+    else:
+        last_run = f"{int(now - s.last_run_at)}s ago" if pd.notna(s.last_run_at) else "pending"
+        st.success(
+            f"Auditor {s.holder} online | last pass {last_run}: "
+            f"{s.last_pending or 0} pending, {s.last_approved or 0} approved, {s.last_held or 0} held",
+            icon="✅"
         )
-        clean_json = re.search(r"\{.*\}", res.choices[0].message.content, re.DOTALL).group()
-        data = json.loads(clean_json)
-
-        for tid in data.get("safe", []):
-            update_txn(tid, "Approved", "Y", "Passed Automated Audit")
-        for h in data.get("hold", []):
-            # Save the reason directly to the DB
-            update_txn(h["id"], "On Hold", "N", h["reason"])
-            
-    except Exception as e:
-        print(f"Agent Error: {e}")
-    conn.close()
 
 # ================= MAIN UI =================
 st.title("🛡️ Sentinel Forensic Dashboard")
 
-# Run Background Agent
-background_audit_agent()
+# Auditor Service Status
+auditor_status_panel()
 
 # Display On Hold Table
 conn = get_db_connection()
@@ -207,7 +141,6 @@ hold_df = pd.read_sql("""
     WHERE (transaction_status='On Hold' OR transaction_status='Declined') 
     AND Internal_Flag='N'
 """, conn)
-conn.close()
 
 st.subheader(f"🚨 Anomalies Awaiting Review ({len(hold_df)})")
 if not hold_df.empty:
@@ -227,6 +160,7 @@ if not hold_df.empty:
         if new_tid != st.session_state.selected_tid:
             st.session_state.selected_tid = new_tid
             st.session_state.forensic_report = "" 
+            st.session_state.forensic_done = False
             st.rerun()
 
 # ================= DETAIL VIEW =================
@@ -238,7 +172,6 @@ if st.session_state.selected_tid:
         FROM Transactions t JOIN Customer c ON t.customer_id=c.customer_id 
         JOIN RelationshipManager rm ON c.rm_id=rm.rm_id WHERE t.transaction_id=?
     """, conn, params=(tid,))
-    conn.close()
 
     if not details.empty:
         r = details.iloc[0]
@@ -254,46 +187,76 @@ if st.session_state.selected_tid:
 
         # ================= AGENT 2: FORENSIC INVESTIGATOR =================
         with st.expander("🔬 Agent 2: LLM Forensic Investigation", expanded=True):
-            if not st.session_state.forensic_report:
-                with st.spinner("Analyzing banking rules..."):
-                    # Use r.note (from DB) instead of session_state for reliability
-                    f_prompt = f"Perform forensic audit for {r.to_dict()}. Detected reason: {r.get('note', 'Unknown')}"
-                    f_res = client.chat.completions.create(model="llama-3.3-70b-versatile", messages=[{"role": "user", "content": f_prompt}])
-                    st.session_state.forensic_report = f_res.choices[0].message.content
-            st.markdown(st.session_state.forensic_report)
+            if not st.session_state.forensic_done:
+                # Use r.note (from DB) instead of session_state for reliability
+                f_prompt = f"Perform forensic audit for {r.to_dict()}. Detected reason: {r.get('note', 'Unknown')}"
+                f_messages = [{"role": "user", "content": f_prompt}]
+
+                # A rerun mid-stream keeps what already arrived; show it and ask for the rest.
+                # One placeholder for both parts, so markdown cut mid-list or mid-table renders as one report.
+                report = st.empty()
+                partial = st.session_state.forensic_report
+                if partial:
+                    report.markdown(partial)
+                    f_messages = continuation_messages(f_messages, partial)
+
+                def save_report(text):
+                    st.session_state.forensic_report = partial + text
+                    report.markdown(st.session_state.forensic_report)
+
+                for _ in stream_completion(get_llm_client(), f_messages, save_report, model="llama-3.3-70b-versatile"):
+                    pass
+                st.session_state.forensic_done = True
+            else:
+                st.markdown(st.session_state.forensic_report)
 
         # ================= AGENT 3: CUSTOMER OUTREACH =================
         with st.expander("✉️ Agent 3: Customer Outreach Bot", expanded=True):
             st.info("Agent 3 can draft and simulate sending a verification email to the customer.")
+            draft = st.session_state.email_draft if st.session_state.email_draft.get("tid") == tid else {}
             if st.button("📧 Draft & Send Verification Email", key="agent3_email_btn"):
-                with st.spinner("Agent 3 is composing email..."):
-                    email_prompt = f"""
-                    You are {r.rm_name}, a Relationship Manager at Sentinel Bank.
-                    Write a professional, urgent but polite email to your customer, {r.customer_name}.
-                    
-                    Goal: Ask them to verify a suspicious transaction.
-                    
-                    Details:
-                    - Transaction ID: {tid}
-                    - Amount: {r.amount} {r.currency}
-                    - Location: {r.transaction_place}
-                    - Date: {r.transaction_date_time}
-                    
-                    Format:
-                    From: {r.rm_name} <{r.rm_email}>
-                    To: {r.customer_name} <{r.cust_email}>
-                    Subject: [URGENT] Verify Activity on your Account
-                    Body: [Your drafted text here]
-                    """
-                    
-                    email_res = client.chat.completions.create(
-                        model="llama-3.3-70b-versatile", 
-                        messages=[{"role": "user", "content": email_prompt}]
-                    )
-                    email_body = email_res.choices[0].message.content
-                    
-                    st.success(f"✅ Email successfully sent to {r.cust_email}")
-                    st.text_area("Generated Email Log:", value=email_body, height=300)
+                email_prompt = f"""
+                You are {r.rm_name}, a Relationship Manager at Sentinel Bank.
+                Write a professional, urgent but polite email to your customer, {r.customer_name}.
+                
+                Goal: Ask them to verify a suspicious transaction.
+                
+                Details:
+                - Transaction ID: {tid}
+                - Amount: {r.amount} {r.currency}
+                - Location: {r.transaction_place}
+                - Date: {r.transaction_date_time}
+                
+                Format:
+                From: {r.rm_name} <{r.rm_email}>
+                To: {r.customer_name} <{r.cust_email}>
+                Subject: [URGENT] Verify Activity on your Account
+                Body: [Your drafted text here]
+                """
+                
+                email_messages = [{"role": "user", "content": email_prompt}]
+
+                # Finish an interrupted draft for this case instead of starting over
+                email = st.empty()
+                partial = draft.get("text", "") if not draft.get("done") else ""
+                if partial:
+                    email.text(partial)
+                    email_messages = continuation_messages(email_messages, partial)
+                st.session_state.email_draft = {"tid": tid, "text": partial, "done": False}
+
+                def save_draft(text):
+                    st.session_state.email_draft["text"] = partial + text
+                    email.text(st.session_state.email_draft["text"])
+
+                for _ in stream_completion(get_llm_client(), email_messages, save_draft, model="llama-3.3-70b-versatile"):
+                    pass
+                st.session_state.email_draft["done"] = True
+
+                st.success(f"✅ Email successfully sent to {r.cust_email}")
+            elif draft:
+                if not draft["done"]:
+                    st.caption("⏸️ Draft was interrupted. Click the button to finish it.")
+                st.text_area("Generated Email Log:", value=draft["text"], height=300)
 
         # Decision Buttons
         st.divider()
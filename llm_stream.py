@@ -0,0 +1,29 @@
+# ================= STREAMED COMPLETIONS =================
+# Shared by the Streamlit pages so long answers render token by token
+# (st.write_stream) instead of after the full completion arrives.
+
+RESUME_INSTRUCTION = "Continue exactly where you stopped. Do not repeat any text already written."
+
+def stream_completion(client, messages, on_text=None, **kwargs):
+    """Yields text deltas of a streamed chat completion.
+
+    on_text(text_so_far) runs after every delta, so callers can persist the
+    partial answer (e.g. in st.session_state) and survive an interrupted rerun.
+    """
+    text = ""
+    for chunk in client.chat.completions.create(messages=messages, stream=True, **kwargs):
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ""
+        if delta:
+            text += delta
+            if on_text:
+                on_text(text)
+            yield delta
+
+def continuation_messages(messages, partial):
+    """Messages that ask the model to finish `partial` instead of starting over."""
+    return messages + [
+        {"role": "assistant", "content": partial},
+        {"role": "user", "content": RESUME_INSTRUCTION},
+    ]
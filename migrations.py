@@ -0,0 +1,163 @@
+import sqlite3
+
+from rule_hits import (RULE_HITS_DDL, LEGACY_NOTES_IMPORT, RULE_HITS_COLUMNS, RULE_HITS_FILL_COLUMNS,
+                       ROLLUP_DDL, ROLLUP_REBUILD)
+
+# ================= VERSIONED MIGRATIONS =================
+# The applied version lives in PRAGMA user_version, so each step runs once per
+# database instead of on every Streamlit rerun. Steps must stay idempotent:
+# databases created before versioning start at version 0 with tables present.
+
+BASE_TABLES = '''
+    CREATE TABLE IF NOT EXISTS RelationshipManager (
+        rm_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        rm_name TEXT NOT NULL, phone_number TEXT NOT NULL, email_id TEXT NOT NULL);
+
+    CREATE TABLE IF NOT EXISTS Customer (
+        customer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        customer_name TEXT NOT NULL, customer_account INTEGER NOT NULL, city_name TEXT NOT NULL, postal_code TEXT,
+        phone_number TEXT NOT NULL, email_id TEXT NOT NULL, ssn_number TEXT NOT NULL,
+        rm_id INTEGER NOT NULL, Country TEXT, FOREIGN KEY (rm_id) REFERENCES RelationshipManager(rm_id));
+
+    CREATE TABLE IF NOT EXISTS Transactions (
+        transaction_id TEXT PRIMARY KEY,
+        customer_id INTEGER NOT NULL,
+        transaction_date_time TEXT NOT NULL,
+        transaction_place TEXT NOT NULL,
+        transaction_category TEXT NOT NULL,
+        transaction_type TEXT NOT NULL,
+        source_account_id INTEGER,
+        destination_account_id INTEGER,
+        destination_bank_name TEXT,
+        amount REAL NOT NULL,
+        currency TEXT DEFAULT 'USD',
+        transaction_status TEXT DEFAULT 'Pending',
+        Internal_Flag TEXT DEFAULT 'N',
+        transaction_country TEXT NOT NULL,
+        note TEXT,
+        email_sent TEXT DEFAULT 'NO',
+        FOREIGN KEY (customer_id) REFERENCES Customer(customer_id));
+
+    CREATE TABLE IF NOT EXISTS fraud_transaction (
+        transaction_id TEXT NOT NULL PRIMARY KEY,
+        customer_id INTEGER NOT NULL,
+        customer_name TEXT NOT NULL,
+        customer_email TEXT NOT NULL,
+        customer_phone_number TEXT NOT NULL,
+        customer_home_city TEXT NOT NULL,
+        rm_name TEXT NOT NULL,
+        rm_email TEXT NOT NULL,
+        rm_phone TEXT NOT NULL,
+        transaction_date_time TEXT NOT NULL,
+        transaction_place TEXT NOT NULL,
+        destination_bank_name TEXT NOT NULL,
+        amount REAL NOT NULL,
+        currency TEXT DEFAULT 'USD',
+        transaction_status TEXT NOT NULL,
+        status TEXT DEFAULT 'N',
+        forensic_summary TEXT NOT NULL);
+'''
+
+# Columns added to the original tables after they were first shipped
+LATE_COLUMNS = [
+    ("Customer", "Country", "TEXT"),
+    ("Transactions", "transaction_country", "TEXT"),
+    ("Transactions", "note", "TEXT"),
+    ("Transactions", "email_sent", "TEXT DEFAULT 'NO'"),
+]
+
+def run_statements(conn, script):
+    """Like executescript, but without its implicit COMMIT so a step stays inside our transaction."""
+    pending = ""
+    for line in script.splitlines(keepends=True):
+        pending += line
+        if sqlite3.complete_statement(pending):
+            conn.execute(pending)
+            pending = ""
+
+def _base_tables(conn):
+    run_statements(conn, BASE_TABLES)
+    # Seed AUTOINCREMENT ranges on a fresh database
+    if conn.execute("SELECT count(*) FROM sqlite_sequence").fetchone()[0] == 0:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('RelationshipManager', 9999999)")
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('Customer', 99999)")
+
+def _late_columns(conn):
+    for table, column, decl in LATE_COLUMNS:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def _rule_hits(conn):
+    run_statements(conn, RULE_HITS_DDL)
+    conn.execute(LEGACY_NOTES_IMPORT)
+
+def _customer_time_index(conn):
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_transactions_customer_time
+                    ON Transactions (customer_id, transaction_date_time, transaction_id)""")
+
+# Single-leader lease for background services, plus the leader's last-run status
+SERVICE_LEASES = '''
+    CREATE TABLE IF NOT EXISTS service_leases (
+        service TEXT PRIMARY KEY,
+        holder TEXT NOT NULL,
+        acquired_at REAL NOT NULL,
+        lease_expires_at REAL NOT NULL,
+        last_run_at REAL,
+        last_pending INTEGER,
+        last_approved INTEGER,
+        last_held INTEGER,
+        last_error TEXT);
+'''
+
+def _service_leases(conn):
+    run_statements(conn, SERVICE_LEASES)
+
+def _time_index(conn):
+    # window_detector warm-up reads the last hour across all customers
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_time ON Transactions (transaction_date_time)")
+
+def _rule_hit_rollups(conn):
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(rule_hits)")}
+    for column, decl in RULE_HITS_COLUMNS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE rule_hits ADD COLUMN {column} {decl}")
+    conn.execute(RULE_HITS_FILL_COLUMNS)
+    run_statements(conn, ROLLUP_DDL)
+    run_statements(conn, ROLLUP_REBUILD)
+
+MIGRATIONS = [
+    (1, "base tables", _base_tables),
+    (2, "note / email_sent / country columns", _late_columns),
+    (3, "rule_hits table and views", _rule_hits),
+    (4, "Transactions (customer_id, time) index", _customer_time_index),
+    (5, "service_leases table", _service_leases),
+    (6, "Transactions (time) index", _time_index),
+    (7, "rule_hits reporting rollups", _rule_hit_rollups),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_migrated = set()  # db paths already checked by this process
+
+def migrate(db_path):
+    """Brings db_path up to SCHEMA_VERSION. Cheap no-op after the first call per process."""
+    if db_path in _migrated:
+        return
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            # IMMEDIATE takes the write lock first, so two processes cannot both apply a step
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for step, name, apply in MIGRATIONS:
+                if step > version:
+                    print(f"[MIGRATE] {db_path}: v{step} {name}")
+                    apply(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    _migrated.add(db_path)
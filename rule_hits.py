@@ -0,0 +1,234 @@
+import json
+import re
+
+# ================= SCHEMA =================
+# One row per (transaction, rule) detection. Replaces parsing of the free-text
+# `note` column ("[RULE:VELOCITY] ...") for reporting and downstream agents.
+RULE_HITS_DDL = '''
+    CREATE TABLE IF NOT EXISTS rule_hits (
+        transaction_id TEXT NOT NULL,
+        rule_id TEXT NOT NULL,
+        score REAL,
+        evidence TEXT,
+        detected_at TEXT NOT NULL DEFAULT (DATETIME('now')),
+        PRIMARY KEY (transaction_id, rule_id),
+        FOREIGN KEY (transaction_id) REFERENCES Transactions(transaction_id));
+
+    CREATE INDEX IF NOT EXISTS idx_rule_hits_rule_time ON rule_hits (rule_id, detected_at);
+    CREATE INDEX IF NOT EXISTS idx_rule_hits_time ON rule_hits (detected_at);
+
+    CREATE VIEW IF NOT EXISTS rule_hit_rate_by_rule AS
+        SELECT rule_id,
+               COUNT(*) AS hits,
+               ROUND(AVG(score), 3) AS avg_score,
+               ROUND(COUNT(*) * 1.0 / (SELECT COUNT(*) FROM Transactions), 4) AS hit_rate,
+               MIN(detected_at) AS first_hit,
+               MAX(detected_at) AS last_hit
+        FROM rule_hits
+        GROUP BY rule_id;
+
+    CREATE VIEW IF NOT EXISTS rule_hit_rate_by_day AS
+        SELECT DATE(detected_at) AS day,
+               rule_id,
+               COUNT(*) AS hits,
+               ROUND(AVG(score), 3) AS avg_score
+        FROM rule_hits
+        GROUP BY DATE(detected_at), rule_id;
+
+    CREATE VIEW IF NOT EXISTS rule_hit_rate_by_rm AS
+        SELECT rm.rm_id, rm.rm_name, h.rule_id,
+               COUNT(*) AS hits,
+               ROUND(COUNT(*) * 1.0 / (
+                   SELECT COUNT(*) FROM Transactions t2
+                   JOIN Customer c2 ON t2.customer_id = c2.customer_id
+                   WHERE c2.rm_id = rm.rm_id), 4) AS hit_rate
+        FROM rule_hits h
+        JOIN Transactions t ON h.transaction_id = t.transaction_id
+        JOIN Customer c ON t.customer_id = c.customer_id
+        JOIN RelationshipManager rm ON c.rm_id = rm.rm_id
+        GROUP BY rm.rm_id, h.rule_id;
+'''
+
+# One-time import (see migrations.py) of hits that only exist as "[RULE:XXX] text" notes.
+LEGACY_NOTES_IMPORT = '''
+    INSERT OR IGNORE INTO rule_hits (transaction_id, rule_id, score, evidence)
+    SELECT transaction_id,
+           SUBSTR(note, 7, INSTR(note, ']') - 7),
+           NULL,
+           JSON_OBJECT('summary', TRIM(SUBSTR(note, INSTR(note, ']') + 1)), 'source', 'legacy_note')
+    FROM Transactions
+    WHERE note LIKE '[RULE:%]%'
+'''
+
+# ================= REPORTING ROLLUPS =================
+# Hit-rate reports read two small pre-aggregated tables instead of scanning
+# Transactions: rule_hit_rollup (kept by record_rule_hit) and
+# transaction_daily_counts (kept by triggers on Transactions). Both are keyed
+# by transaction date and by the customer's RM at the time of the write.
+RULE_HITS_COLUMNS = [
+    ("customer_id", "INTEGER"),
+    ("rm_id", "INTEGER"),
+    ("txn_date", "TEXT"),
+]
+
+RULE_HITS_FILL_COLUMNS = '''
+    UPDATE rule_hits SET
+        customer_id = (SELECT t.customer_id FROM Transactions t WHERE t.transaction_id = rule_hits.transaction_id),
+        txn_date = (SELECT DATE(t.transaction_date_time) FROM Transactions t WHERE t.transaction_id = rule_hits.transaction_id),
+        rm_id = (SELECT c.rm_id FROM Transactions t JOIN Customer c ON t.customer_id = c.customer_id
+                 WHERE t.transaction_id = rule_hits.transaction_id)
+'''
+
+ROLLUP_DDL = '''
+    CREATE TABLE IF NOT EXISTS rule_hit_rollup (
+        day TEXT NOT NULL,
+        rule_id TEXT NOT NULL,
+        rm_id INTEGER NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0,
+        scored INTEGER NOT NULL DEFAULT 0,
+        score_sum REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, rule_id, rm_id));
+
+    CREATE TABLE IF NOT EXISTS transaction_daily_counts (
+        day TEXT NOT NULL,
+        rm_id INTEGER NOT NULL,
+        txns INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, rm_id));
+
+    CREATE INDEX IF NOT EXISTS idx_rule_hits_rule_date ON rule_hits (rule_id, txn_date);
+
+    -- Only the old detected_at views used these; each hit would otherwise maintain three indexes
+    DROP INDEX IF EXISTS idx_rule_hits_rule_time;
+    DROP INDEX IF EXISTS idx_rule_hits_time;
+
+    CREATE TRIGGER IF NOT EXISTS trg_txn_daily_counts_insert AFTER INSERT ON Transactions
+    BEGIN
+        INSERT INTO transaction_daily_counts (day, rm_id, txns)
+        VALUES (COALESCE(DATE(NEW.transaction_date_time), ''),
+                COALESCE((SELECT rm_id FROM Customer WHERE customer_id = NEW.customer_id), 0), 1)
+        ON CONFLICT (day, rm_id) DO UPDATE SET txns = txns + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_txn_daily_counts_delete AFTER DELETE ON Transactions
+    BEGIN
+        UPDATE transaction_daily_counts SET txns = txns - 1
+        WHERE day = COALESCE(DATE(OLD.transaction_date_time), '')
+          AND rm_id = COALESCE((SELECT rm_id FROM Customer WHERE customer_id = OLD.customer_id), 0);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_txn_daily_counts_update
+    AFTER UPDATE OF transaction_date_time, customer_id ON Transactions
+    BEGIN
+        UPDATE transaction_daily_counts SET txns = txns - 1
+        WHERE day = COALESCE(DATE(OLD.transaction_date_time), '')
+          AND rm_id = COALESCE((SELECT rm_id FROM Customer WHERE customer_id = OLD.customer_id), 0);
+        INSERT INTO transaction_daily_counts (day, rm_id, txns)
+        VALUES (COALESCE(DATE(NEW.transaction_date_time), ''),
+                COALESCE((SELECT rm_id FROM Customer WHERE customer_id = NEW.customer_id), 0), 1)
+        ON CONFLICT (day, rm_id) DO UPDATE SET txns = txns + 1;
+    END;
+
+    DROP VIEW IF EXISTS rule_hit_rate_by_rule;
+    CREATE VIEW rule_hit_rate_by_rule AS
+        WITH total AS (SELECT SUM(txns) AS txns FROM transaction_daily_counts)
+        SELECT r.rule_id,
+               SUM(r.hits) AS hits,
+               ROUND(SUM(r.score_sum) / NULLIF(SUM(r.scored), 0), 3) AS avg_score,
+               ROUND(SUM(r.hits) * 1.0 / NULLIF(total.txns, 0), 4) AS hit_rate,
+               MIN(r.day) AS first_day,
+               MAX(r.day) AS last_day
+        FROM rule_hit_rollup r, total
+        GROUP BY r.rule_id;
+
+    DROP VIEW IF EXISTS rule_hit_rate_by_day;
+    CREATE VIEW rule_hit_rate_by_day AS
+        WITH daily AS (SELECT day, SUM(txns) AS txns FROM transaction_daily_counts GROUP BY day),
+             hits AS (SELECT day, rule_id, SUM(hits) AS hits, SUM(score_sum) AS score_sum, SUM(scored) AS scored
+                      FROM rule_hit_rollup GROUP BY day, rule_id)
+        SELECT h.day, h.rule_id, h.hits,
+               ROUND(h.score_sum / NULLIF(h.scored, 0), 3) AS avg_score,
+               ROUND(h.hits * 1.0 / NULLIF(d.txns, 0), 4) AS hit_rate
+        FROM hits h LEFT JOIN daily d ON d.day = h.day;
+
+    DROP VIEW IF EXISTS rule_hit_rate_by_rm;
+    CREATE VIEW rule_hit_rate_by_rm AS
+        WITH per_rm AS (SELECT rm_id, SUM(txns) AS txns FROM transaction_daily_counts GROUP BY rm_id),
+             hits AS (SELECT rm_id, rule_id, SUM(hits) AS hits, SUM(score_sum) AS score_sum, SUM(scored) AS scored
+                      FROM rule_hit_rollup GROUP BY rm_id, rule_id)
+        SELECT h.rm_id, rm.rm_name, h.rule_id, h.hits,
+               ROUND(h.score_sum / NULLIF(h.scored, 0), 3) AS avg_score,
+               ROUND(h.hits * 1.0 / NULLIF(p.txns, 0), 4) AS hit_rate
+        FROM hits h
+        LEFT JOIN per_rm p ON p.rm_id = h.rm_id
+        LEFT JOIN RelationshipManager rm ON rm.rm_id = h.rm_id;
+'''
+
+# One-time rebuild of both rollups from the detail tables
+ROLLUP_REBUILD = '''
+    DELETE FROM rule_hit_rollup;
+    INSERT INTO rule_hit_rollup (day, rule_id, rm_id, hits, scored, score_sum)
+        SELECT COALESCE(txn_date, ''), rule_id, COALESCE(rm_id, 0), COUNT(*), COUNT(score), COALESCE(SUM(score), 0)
+        FROM rule_hits
+        GROUP BY 1, 2, 3;
+
+    DELETE FROM transaction_daily_counts;
+    INSERT INTO transaction_daily_counts (day, rm_id, txns)
+        SELECT COALESCE(DATE(t.transaction_date_time), ''), COALESCE(c.rm_id, 0), COUNT(*)
+        FROM Transactions t LEFT JOIN Customer c ON t.customer_id = c.customer_id
+        GROUP BY 1, 2;
+'''
+
+RULE_TAG = re.compile(r"^\s*\[RULE:([A-Z0-9_\- ]+)\]\s*(.*)$", re.DOTALL)
+
+# ================= HELPERS =================
+
+def split_reason(reason):
+    """'[RULE:VELOCITY] 4 txns in 10s' -> ('VELOCITY', '4 txns in 10s'). Untagged text gets rule 'UNSPECIFIED'."""
+    match = RULE_TAG.match(str(reason or ""))
+    if match:
+        return match.group(1).strip(), match.group(2).strip()
+    return "UNSPECIFIED", str(reason or "").strip()
+
+def record_rule_hit(conn, tid, rule_id, summary, score=None, evidence=None):
+    """Upserts one detection. `evidence` should be a dict; anything else the LLM sends is kept under 'raw'."""
+    if isinstance(evidence, dict):
+        payload = dict(evidence)
+    else:
+        payload = {} if evidence is None else {"raw": evidence}
+    payload["summary"] = summary
+    evidence_json = json.dumps(payload, default=str)
+    tid = str(tid)
+
+    old = conn.execute(
+        "SELECT score, txn_date, rm_id FROM rule_hits WHERE transaction_id=? AND rule_id=?", (tid, rule_id)
+    ).fetchone()
+    if old:
+        old_score, day, rm_id = old
+        conn.execute(
+            "UPDATE rule_hits SET score=?, evidence=?, detected_at=DATETIME('now') WHERE transaction_id=? AND rule_id=?",
+            (score, evidence_json, tid, rule_id)
+        )
+        hits_delta = 0
+    else:
+        txn = conn.execute("""
+            SELECT t.customer_id, c.rm_id, DATE(t.transaction_date_time)
+            FROM Transactions t LEFT JOIN Customer c ON t.customer_id = c.customer_id
+            WHERE t.transaction_id=?
+        """, (tid,)).fetchone() or (None, None, None)
+        customer_id, rm_id, day = txn
+        conn.execute(
+            """INSERT INTO rule_hits (transaction_id, rule_id, score, evidence, detected_at, customer_id, rm_id, txn_date)
+               VALUES (?, ?, ?, ?, DATETIME('now'), ?, ?, ?)""",
+            (tid, rule_id, score, evidence_json, customer_id, rm_id, day)
+        )
+        old_score, hits_delta = None, 1
+
+    conn.execute("""
+        INSERT INTO rule_hit_rollup (day, rule_id, rm_id, hits, scored, score_sum) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (day, rule_id, rm_id) DO UPDATE SET
+            hits = hits + excluded.hits,
+            scored = scored + excluded.scored,
+            score_sum = score_sum + excluded.score_sum
+    """, (day or "", rule_id, rm_id or 0, hits_delta,
+          (score is not None) - (old_score is not None),
+          (score or 0) - (old_score or 0)))
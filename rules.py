@@ -0,0 +1,146 @@
+from collections import deque, namedtuple
+
+# ================= RULE SETTINGS =================
+# Deterministic versions of the detection rules given to the LLM auditor in
+# auditor_service.build_prompt. Used where an LLM call per row is not an option
+# (backfill). GEO-ANOMALY checks the customer's home country as well as their
+# history; the home city is only compared through history, because the live
+# city rule is bounded to 1 hour and a home city has no timestamp.
+RULESET_VERSION = "v1"
+
+VELOCITY_WINDOW_S = 60
+GEO_CITY_WINDOW_S = 60 * 60            # different city, same country
+GEO_COUNTRY_WINDOW_S = 36 * 60 * 60    # different country
+PASS_THROUGH_WINDOW_S = 60 * 60
+PASS_THROUGH_TOLERANCE = 0.10          # "similar value" = within 10%
+MICRO_PROBE_WINDOW_S = 60 * 60
+MICRO_PROBE_MAX = 5.00
+MICRO_PROBE_FOLLOW_MIN = 500.00
+DORMANCY_S = 30 * 24 * 60 * 60
+DORMANCY_MIN_AMOUNT = 1000.00
+STRUCTURING_BAND = (9000.00, 9999.99)
+
+# Longest look-back any rule needs; older events are dropped from state
+MAX_WINDOW_S = max(VELOCITY_WINDOW_S, GEO_CITY_WINDOW_S, GEO_COUNTRY_WINDOW_S,
+                   PASS_THROUGH_WINDOW_S, MICRO_PROBE_WINDOW_S)
+
+RULE_SCORES = {
+    "SAME-TIME COLLISION": 0.95,
+    "MICRO-PROBING": 0.85,
+    "VELOCITY": 0.80,
+    "PASS-THROUGH": 0.75,
+    "GEO-ANOMALY": 0.70,
+    "STRUCTURING": 0.60,
+    "DORMANCY WAKE-UP": 0.50,
+}
+
+# ts = epoch seconds, direction = 'C' (money in) or 'D' (money out)
+# home_city / home_country come from the Customer row, when the caller has it
+Txn = namedtuple("Txn", "transaction_id customer_id ts when place country amount direction home_city home_country",
+                 defaults=(None, None))
+
+def direction_of(category, txn_type):
+    """Credit/Deposit rows bring money in, everything else moves it out."""
+    if category == "Credit" or txn_type == "Deposit":
+        return "C"
+    return "D"
+
+def hit(rule_id, summary, **evidence):
+    return (rule_id, RULE_SCORES[rule_id], summary, evidence)
+
+# ================= PER-CUSTOMER STATE =================
+
+class CustomerState:
+    """Everything the rules need to remember about one customer's earlier transactions."""
+
+    def __init__(self, customer_id):
+        self.customer_id = customer_id
+        self.recent = deque()            # Txn within MAX_WINDOW_S of the latest event
+        self.last_ts = None
+        self.seen_structuring_band = False
+
+    def copy(self):
+        clone = CustomerState(self.customer_id)
+        clone.recent = deque(self.recent)
+        clone.last_ts = self.last_ts
+        clone.seen_structuring_band = self.seen_structuring_band
+        return clone
+
+    def observe(self, txn):
+        """Adds txn to the state without evaluating it."""
+        self.recent.append(txn)
+        while self.recent and txn.ts - self.recent[0].ts > MAX_WINDOW_S:
+            self.recent.popleft()
+        self.last_ts = txn.ts
+        if STRUCTURING_BAND[0] <= txn.amount <= STRUCTURING_BAND[1]:
+            self.seen_structuring_band = True
+
+    def evaluate(self, txn):
+        """Returns [(rule_id, score, summary, evidence)] for txn against the earlier events."""
+        hits = []
+        velocity = []
+        for prev in reversed(self.recent):
+            gap = txn.ts - prev.ts
+            if gap < 0:
+                continue
+            if gap == 0 and prev.place != txn.place:
+                hits.append(hit("SAME-TIME COLLISION",
+                                f"Same second in {prev.place} and {txn.place}.",
+                                other_transaction_id=prev.transaction_id, when=txn.when,
+                                places=[prev.place, txn.place]))
+            if gap < VELOCITY_WINDOW_S:
+                velocity.append(prev.transaction_id)
+            if gap <= GEO_COUNTRY_WINDOW_S and prev.country and txn.country and prev.country != txn.country:
+                hits.append(hit("GEO-ANOMALY",
+                                f"Jump from {prev.place}, {prev.country} to {txn.place}, {txn.country} in {gap // 60} mins.",
+                                other_transaction_id=prev.transaction_id, gap_s=gap,
+                                from_country=prev.country, to_country=txn.country))
+            elif gap <= GEO_CITY_WINDOW_S and prev.country == txn.country and prev.place != txn.place:
+                hits.append(hit("GEO-ANOMALY",
+                                f"Jump from {prev.place} to {txn.place} in {gap // 60} mins.",
+                                other_transaction_id=prev.transaction_id, gap_s=gap,
+                                from_place=prev.place, to_place=txn.place))
+            if (txn.direction == "D" and prev.direction == "C" and gap < PASS_THROUGH_WINDOW_S
+                    and prev.amount > 0
+                    and abs(txn.amount - prev.amount) <= PASS_THROUGH_TOLERANCE * prev.amount):
+                hits.append(hit("PASS-THROUGH",
+                                f"Debit of {txn.amount} {gap // 60} mins after credit of {prev.amount}.",
+                                credit_transaction_id=prev.transaction_id, gap_s=gap,
+                                credit_amount=prev.amount, debit_amount=txn.amount))
+            if (prev.amount < MICRO_PROBE_MAX and txn.amount > MICRO_PROBE_FOLLOW_MIN
+                    and gap < MICRO_PROBE_WINDOW_S):
+                hits.append(hit("MICRO-PROBING",
+                                f"Small transaction of {prev.amount} followed by large transaction of {txn.amount}",
+                                probe_transaction_id=prev.transaction_id, gap_s=gap,
+                                probe_amount=prev.amount, amount=txn.amount))
+
+        # Home country check; history-based GEO hits above take precedence as closer evidence
+        if txn.home_country and txn.country and txn.country != txn.home_country:
+            hits.append(hit("GEO-ANOMALY",
+                            f"Transaction in {txn.place}, {txn.country} outside home country {txn.home_country}.",
+                            home_city=txn.home_city, home_country=txn.home_country, to_country=txn.country))
+        if velocity:
+            hits.append(hit("VELOCITY",
+                            f"{len(velocity) + 1} transactions detected in {VELOCITY_WINDOW_S} seconds.",
+                            other_transaction_ids=velocity))
+        if STRUCTURING_BAND[0] <= txn.amount <= STRUCTURING_BAND[1] and not self.seen_structuring_band:
+            hits.append(hit("STRUCTURING",
+                            f"Amount {txn.amount} just below the 10,000 reporting limit with no earlier precedent.",
+                            amount=txn.amount))
+        if (self.last_ts is not None and txn.ts - self.last_ts > DORMANCY_S
+                and txn.amount > DORMANCY_MIN_AMOUNT):
+            idle_days = (txn.ts - self.last_ts) // 86400
+            hits.append(hit("DORMANCY WAKE-UP",
+                            f"{txn.amount} after {idle_days} days without activity.",
+                            idle_days=idle_days, amount=txn.amount))
+
+        # One hit per rule: keep the closest-in-time piece of evidence
+        unique = {}
+        for h in hits:
+            unique.setdefault(h[0], h)
+        return list(unique.values())
+
+    def process(self, txn):
+        hits = self.evaluate(txn)
+        self.observe(txn)
+        return hits
@@ -1,81 +1,37 @@
 import streamlit as st
 import sqlite3
 import pandas as pd
-from openai import OpenAI  
-import time
+from migrations import migrate
+from llm_stream import stream_completion
 
 # --- 1. SETUP & CONFIG ---
 # Replace with your actual key or use st.secrets
 GROQ_API_KEY =  # Ensure this is set
-client = OpenAI(base_url="https://api.groq.com/openai/v1", api_key=GROQ_API_KEY)
+DB_PATH = "fraud_detection.db"
 
 st.set_page_config(layout="wide", page_title="Sentinel SQL Admin", page_icon="🛡️")
 
 # --- 2. DATABASE INITIALIZATION ---
+# Migrations are cached per process: Streamlit reruns the script on every
+# interaction, and the schema DDL lives in migrations.py. The connection itself
+# is per session, so concurrent sessions never share one sqlite3 connection.
+@st.cache_resource
+def ensure_schema():
+    migrate(DB_PATH)
+    return DB_PATH
+
 def init_db():
-    conn = sqlite3.connect('fraud_detection.db', check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.executescript('''
-        PRAGMA foreign_keys = ON;
-        
-        CREATE TABLE IF NOT EXISTS RelationshipManager (
-            rm_id INTEGER PRIMARY KEY AUTOINCREMENT, 
-            rm_name TEXT NOT NULL, phone_number TEXT NOT NULL, email_id TEXT NOT NULL);
-        
-        CREATE TABLE IF NOT EXISTS Customer (
-            customer_id INTEGER PRIMARY KEY AUTOINCREMENT, 
-            customer_name TEXT NOT NULL, customer_account INTEGER NOT NULL, city_name TEXT NOT NULL, postal_code TEXT, 
-            phone_number TEXT NOT NULL, email_id TEXT NOT NULL, ssn_number TEXT NOT NULL, 
-            rm_id INTEGER NOT NULL, FOREIGN KEY (rm_id) REFERENCES RelationshipManager(rm_id));
-            
-        CREATE TABLE IF NOT EXISTS Transactions (
-            transaction_id TEXT PRIMARY KEY, 
-            customer_id INTEGER NOT NULL, 
-            transaction_date_time TEXT NOT NULL, 
-            transaction_place TEXT NOT NULL, 
-            transaction_category TEXT NOT NULL, 
-            transaction_type TEXT NOT NULL,
-            source_account_id INTEGER,
-            destination_account_id INTEGER, 
-            destination_bank_name TEXT,
-            amount REAL NOT NULL,
-            currency TEXT DEFAULT 'USD',
-            transaction_status TEXT DEFAULT 'Pending',
-            Internal_Flag TEXT DEFAULT 'N',
-            transaction_country TEXT NOT NULL,
-            note TEXT,
-            email_sent TEXT DEFAULT 'NO',
-            FOREIGN KEY (customer_id) REFERENCES Customer(customer_id));
-
-            CREATE TABLE IF NOT EXISTS fraud_transaction (
-            transaction_id TEXT NOT NULL, 
-            customer_id INTEGER NOT NULL,
-            customer_name TEXT NOT NULL,
-            customer_email TEXT NOT NULL,
-            customer_phone_number TEXT NOT NULL,
-            customer_home_city TEXT NOT NULL, 
-            rm_name TEXT NOT NULL,
-            rm_email TEXT NOT NULL,
-            rm_phone TEXT NOT NULL,
-            transaction_date_time TEXT NOT NULL, 
-            transaction_place TEXT NOT NULL,
-            destination_bank_name TEXT NOT NULL,
-            amount REAL NOT NULL,
-            currency TEXT DEFAULT 'USD',
-            transaction_status TEXT NOT NULL,
-            status TEXT DEFAULT 'N',
-            forensic_summary TEXT NOT NULL);
-	''')
-    
-    # Initialize sequences if empty
-    cursor.execute("SELECT count(*) FROM sqlite_sequence")
-    if cursor.fetchone()[0] == 0: 
-        cursor.executescript('''
-            INSERT OR IGNORE INTO sqlite_sequence (name, seq) VALUES ('RelationshipManager', 9999999);
-            INSERT OR IGNORE INTO sqlite_sequence (name, seq) VALUES ('Customer', 99999);
-        ''')
-    conn.commit()
-    return conn
+    if "db_conn" not in st.session_state:
+        # Reruns may move between script threads, but one session never runs two at once
+        conn = sqlite3.connect(ensure_schema(), check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys = ON")
+        st.session_state.db_conn = conn
+    return st.session_state.db_conn
+
+@st.cache_resource
+def get_llm_client():
+    from openai import OpenAI
+    return OpenAI(base_url="https://api.groq.com/openai/v1", api_key=GROQ_API_KEY)
 
 conn = init_db()
 
@@ -119,14 +75,27 @@ with st.sidebar:
 
         OUTPUT FORMAT: SQL only in ```sql blocks."""
         
+        # Reply joins history on its first token, so an interrupted rerun still shows it
+        # and an interruption before any token leaves no empty bubble behind
+        reply = {"role": "assistant", "content": ""}
+
         try:
-            completion = client.chat.completions.create(
-                model="llama-3.3-70b-versatile", 
-                messages=[{"role": "system", "content": sys_instr}, {"role": "user", "content": prompt}], 
-                temperature=0
-            )
-            ai_resp = completion.choices[0].message.content
-            st.session_state.messages.append({"role": "assistant", "content": ai_resp})
+            def save_reply(text):
+                if not reply["content"]:
+                    st.session_state.messages.append(reply)
+                reply["content"] = text
+
+            with chat_container:
+                with st.chat_message("user"): st.markdown(prompt)
+                with st.chat_message("assistant"):
+                    st.write_stream(stream_completion(
+                        get_llm_client(),
+                        [{"role": "system", "content": sys_instr}, {"role": "user", "content": prompt}],
+                        save_reply,
+                        model="llama-3.3-70b-versatile",
+                        temperature=0
+                    ))
+            ai_resp = reply["content"]
             
             if "```sql" in ai_resp:
                 st.session_state.pending_sql = ai_resp.split("```sql")[1].split("```")[0].strip()
@@ -158,8 +127,11 @@ if "pending_sql" in st.session_state:
 
 # Table Explorer (Updated Tabs)
 st.subheader("📂 Table Dashboard")
-tabs = st.tabs(["Customer", "Transactions", "RelationshipManager", "Fraud Transactions"])
+tabs = st.tabs(["Customer", "Transactions", "RelationshipManager", "Fraud Transactions", "Rule Hits"])
 with tabs[0]: st.dataframe(pd.read_sql("SELECT * FROM Customer", conn), use_container_width=True)
 with tabs[1]: st.dataframe(pd.read_sql("SELECT * FROM Transactions", conn), use_container_width=True)
 with tabs[2]: st.dataframe(pd.read_sql("SELECT * FROM RelationshipManager", conn), use_container_width=True)
-with tabs[3]: st.dataframe(pd.read_sql("SELECT * FROM fraud_transaction", conn), use_container_width=True)
\ No newline at end of file
+with tabs[3]: st.dataframe(pd.read_sql("SELECT * FROM fraud_transaction", conn), use_container_width=True)
+with tabs[4]:
+    st.dataframe(pd.read_sql("SELECT * FROM rule_hit_rate_by_rule ORDER BY hits DESC", conn), use_container_width=True)
+    st.dataframe(pd.read_sql("SELECT * FROM rule_hit_rate_by_rm ORDER BY hits DESC", conn), use_container_width=True)
\ No newline at end of file
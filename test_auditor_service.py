@@ -0,0 +1,59 @@
+import os
+import sqlite3
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("openai")
+os.environ.setdefault("GROQ_API_KEY", "test-key")  # the client is built at import; no request is sent here
+
+import auditor_service
+from migrations import migrate
+from window_detector import WindowDetector
+
+def make_db(path):
+    """One customer with an Approved txn 30s ago and a Pending one 20s ago (a VELOCITY hit)."""
+    migrate(str(path))
+    conn = sqlite3.connect(str(path))
+    with conn:
+        conn.execute("INSERT INTO RelationshipManager (rm_name, phone_number, email_id) VALUES ('RM', '1', 'rm@bank')")
+        conn.execute("""INSERT INTO Customer (customer_name, customer_account, city_name, phone_number, email_id,
+                                              ssn_number, rm_id, Country)
+                        VALUES ('Cust', 1, 'Phoenix', '2', 'c@mail', '000', (SELECT MAX(rm_id) FROM RelationshipManager), 'USA')""")
+        for tid, age, status, flag in [("T1", 30, "Approved", "Y"), ("T2", 20, "Pending", "N")]:
+            conn.execute("""INSERT INTO Transactions (transaction_id, customer_id, transaction_date_time, transaction_place,
+                                                      transaction_category, transaction_type, amount, transaction_status,
+                                                      Internal_Flag, transaction_country)
+                            VALUES (?, (SELECT MAX(customer_id) FROM Customer), DATETIME('now', ?), 'Phoenix',
+                                    'Shopping', 'Purchase', 100, ?, ?, 'USA')""",
+                         (tid, f"-{age} seconds", status, flag))
+    return conn
+
+def test_window_hold_is_retried_after_failed_write(tmp_path, monkeypatch):
+    conn = make_db(tmp_path / "fraud.db")
+    monkeypatch.setattr(auditor_service, "detector", WindowDetector())
+    monkeypatch.setattr(auditor_service, "unwritten_holds", {})
+    auditor_service.detector.warm_from_db(conn)
+    assert auditor_service.acquire_lease(conn)
+
+    write_hold = auditor_service.hold_window_hits
+    failures = []
+
+    def locked_once(conn, tid, hits):
+        if not failures:
+            failures.append(tid)
+            raise sqlite3.OperationalError("database is locked")
+        write_hold(conn, tid, hits)
+
+    monkeypatch.setattr(auditor_service, "hold_window_hits", locked_once)
+
+    with pytest.raises(sqlite3.OperationalError):
+        auditor_service.audit_pass(conn)
+    assert conn.execute("SELECT transaction_status FROM Transactions WHERE transaction_id='T2'").fetchone() == ("Pending",)
+
+    # The detector already saw T2, so only the retained hits can hold it now
+    assert auditor_service.audit_pass(conn) == (1, 0, 1)
+    status, note = conn.execute("SELECT transaction_status, note FROM Transactions WHERE transaction_id='T2'").fetchone()
+    assert status == "On Hold"
+    assert note.startswith("[RULE:VELOCITY]")
+    assert auditor_service.unwritten_holds == {}
@@ -0,0 +1,49 @@
+import random
+
+from rules import CustomerState, Txn
+from window_detector import WindowDetector
+
+SHORT_RULES = {"VELOCITY", "SAME-TIME COLLISION", "MICRO-PROBING", "PASS-THROUGH"}
+
+# Evidence keys that name the earlier transaction a hit was matched against
+MATCHED_TXN = {
+    "VELOCITY": "other_transaction_ids",
+    "MICRO-PROBING": "probe_transaction_id",
+    "PASS-THROUGH": "credit_transaction_id",
+}
+
+def random_stream(n, customers, seed):
+    """Time-ordered events with bursts, same-second repeats and probe/pass-through shaped amounts."""
+    rng = random.Random(seed)
+    ts = 1_700_000_000
+    events = []
+    for i in range(n):
+        ts += rng.choice([0, 1, 5, 30, 59, 60, 61, 300, 1800, 3599, 3600, 3601, 7200])
+        amount = rng.choice([0.5, 4.99, 5.0, 120.0, 499.0, 501.0, 1000.0, 1050.0, 1099.0, 2500.0])
+        events.append(Txn(f"T{i}", rng.randrange(customers), ts, str(ts),
+                          rng.choice(["London", "Paris", "Leeds"]), "GB", amount, rng.choice("CD")))
+    return events
+
+def summarize(hits):
+    out = {}
+    for rule_id, _score, _summary, evidence in hits:
+        if rule_id in SHORT_RULES:
+            matched = evidence.get(MATCHED_TXN.get(rule_id))
+            out[rule_id] = sorted(matched) if isinstance(matched, list) else matched
+    return out
+
+def test_matches_customer_state_on_ordered_stream():
+    detector = WindowDetector()
+    states = {}
+    for txn in random_stream(20_000, customers=40, seed=7):
+        state = states.setdefault(txn.customer_id, CustomerState(txn.customer_id))
+        assert summarize(detector.process(txn)) == summarize(state.process(txn)), txn
+
+def test_back_dated_event_is_skipped():
+    detector = WindowDetector()
+    for tid, ts in [("A", 1000), ("B", 2000)]:
+        assert detector.process(Txn(tid, 1, ts, str(ts), "London", "GB", 100.0, "D")) == []
+    # 1990 is within 60s of 2000 but older than it: the window must not evaluate or keep it
+    assert detector.process(Txn("C", 1, 1990, "1990", "London", "GB", 100.0, "D")) == []
+    hits = detector.process(Txn("D", 1, 2030, "2030", "London", "GB", 100.0, "D"))
+    assert [(h[0], h[3]["other_transaction_ids"]) for h in hits] == [("VELOCITY", ["B"])]
@@ -0,0 +1,239 @@
+import math
+from array import array
+from collections import OrderedDict
+
+from rules import (Txn, direction_of, hit, VELOCITY_WINDOW_S, PASS_THROUGH_WINDOW_S,
+                   PASS_THROUGH_TOLERANCE, MICRO_PROBE_WINDOW_S, MICRO_PROBE_MAX, MICRO_PROBE_FOLLOW_MIN)
+
+# ================= SETTINGS =================
+# In-process detector for the short-window rules (VELOCITY, SAME-TIME COLLISION,
+# MICRO-PROBING, PASS-THROUGH). Each active customer keeps only the last hour of
+# events in a compact ring buffer, so these rules are decided per event without
+# going back to SQLite or through the LLM prompt.
+SHORT_WINDOW_S = max(VELOCITY_WINDOW_S, PASS_THROUGH_WINDOW_S, MICRO_PROBE_WINDOW_S)
+INITIAL_CAPACITY = 8
+MAX_EVENTS_PER_CUSTOMER = 256   # hard cap: a burst beyond this drops the oldest events early
+
+_BUCKET_BASE = math.log(1 + PASS_THROUGH_TOLERANCE)
+
+def _amount_bucket(amount):
+    """Log-scale bucket; amounts within the pass-through tolerance land at most 2 buckets apart."""
+    return int(math.floor(math.log(amount) / _BUCKET_BASE))
+
+# ================= PER-CUSTOMER RING BUFFER =================
+
+class _Window:
+    """Array-backed ring of one customer's recent events, addressed by sequence number."""
+
+    __slots__ = ("ts", "amount", "place", "credit", "tids", "mask",
+                 "first_seq", "next_seq", "velocity_seq",
+                 "micro_count", "credit_buckets", "last_ts", "second_places")
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.ts = array("d", bytes(8 * capacity))
+        self.amount = array("d", bytes(8 * capacity))
+        self.place = array("l", [0]) * capacity
+        self.credit = array("b", bytes(capacity))
+        self.tids = [None] * capacity
+        self.mask = capacity - 1
+        self.first_seq = 0          # oldest retained event
+        self.next_seq = 0           # slot for the next event
+        self.velocity_seq = 0       # oldest event inside VELOCITY_WINDOW_S of the latest
+        self.micro_count = 0        # retained events below MICRO_PROBE_MAX
+        self.credit_buckets = {}    # amount bucket -> retained credit count
+        self.last_ts = None
+        self.second_places = set()  # place ids seen at last_ts (same-second collision)
+
+    def __len__(self):
+        return self.next_seq - self.first_seq
+
+    def _grow(self):
+        old = (self.ts, self.amount, self.place, self.credit, self.tids, self.mask)
+        capacity = (self.mask + 1) * 2
+        self.ts = array("d", bytes(8 * capacity))
+        self.amount = array("d", bytes(8 * capacity))
+        self.place = array("l", [0]) * capacity
+        self.credit = array("b", bytes(capacity))
+        self.tids = [None] * capacity
+        self.mask = capacity - 1
+        ts, amount, place, credit, tids, old_mask = old
+        for seq in range(self.first_seq, self.next_seq):
+            i, j = seq & old_mask, seq & self.mask
+            self.ts[j], self.amount[j], self.place[j] = ts[i], amount[i], place[i]
+            self.credit[j], self.tids[j] = credit[i], tids[i]
+
+    def pop_oldest(self):
+        i = self.first_seq & self.mask
+        if self.amount[i] < MICRO_PROBE_MAX:
+            self.micro_count -= 1
+        if self.credit[i] and self.amount[i] > 0:
+            bucket = _amount_bucket(self.amount[i])
+            self.credit_buckets[bucket] -= 1
+            if not self.credit_buckets[bucket]:
+                del self.credit_buckets[bucket]
+        tid = self.tids[i]
+        self.tids[i] = None
+        self.first_seq += 1
+        self.velocity_seq = max(self.velocity_seq, self.first_seq)
+        return tid
+
+    def push(self, tid, ts, amount, place_id, is_credit, max_events):
+        """Appends an event; returns the tid dropped early if the buffer was at max_events."""
+        evicted = None
+        if len(self) > self.mask:
+            if self.mask + 1 < max_events:
+                self._grow()
+            else:
+                evicted = self.pop_oldest()
+        i = self.next_seq & self.mask
+        self.ts[i], self.amount[i], self.place[i] = ts, amount, place_id
+        self.credit[i], self.tids[i] = is_credit, tid
+        self.next_seq += 1
+        if amount < MICRO_PROBE_MAX:
+            self.micro_count += 1
+        if is_credit and amount > 0:
+            bucket = _amount_bucket(amount)
+            self.credit_buckets[bucket] = self.credit_buckets.get(bucket, 0) + 1
+        if ts != self.last_ts:
+            self.second_places = set()
+        self.second_places.add(place_id)
+        self.last_ts = ts
+        return evicted
+
+    def latest(self, predicate):
+        """Ring index of the newest retained event matching predicate(index), or None. Only used once a rule has fired."""
+        for seq in range(self.next_seq - 1, self.first_seq - 1, -1):
+            if predicate(seq & self.mask):
+                return seq & self.mask
+        return None
+
+# ================= DETECTOR =================
+
+class WindowDetector:
+    """Per-event short-window rules over all active customers.
+
+    Each event costs O(1) amortized: eviction and the velocity pointer only
+    move forward, and rule counters are maintained on push/evict. That needs
+    each customer's events in time order, so an event older than the
+    customer's latest one is skipped (no hits, not retained) and left to the
+    LLM. Customers idle for longer than the window are dropped, so memory is
+    bounded by the active customer set.
+    """
+
+    def __init__(self, window_s=SHORT_WINDOW_S, max_events=MAX_EVENTS_PER_CUSTOMER):
+        self.window_s = window_s
+        self.max_events = max_events
+        self._windows = OrderedDict()   # customer_id -> _Window, least recently active first
+        self._place_ids = {}
+        self._place_names = []
+        self._seen = set()              # tids currently held in some window
+        self._clock = None              # latest event time seen
+
+    def __len__(self):
+        return len(self._windows)
+
+    def _place_id(self, place):
+        pid = self._place_ids.get(place)
+        if pid is None:
+            pid = self._place_ids[place] = len(self._place_names)
+            self._place_names.append(place)
+        return pid
+
+    def _expire(self, window, now):
+        cutoff = now - self.window_s
+        while len(window) and window.ts[window.first_seq & window.mask] <= cutoff:
+            self._seen.discard(window.pop_oldest())
+
+    def _drop_idle(self):
+        cutoff = self._clock - self.window_s
+        while self._windows:
+            cust, window = next(iter(self._windows.items()))
+            if window.last_ts > cutoff:
+                break
+            for seq in range(window.first_seq, window.next_seq):
+                self._seen.discard(window.tids[seq & window.mask])
+            del self._windows[cust]
+
+    def process(self, txn, evaluate=True):
+        """Adds txn and returns its hits as (rule_id, score, summary, evidence).
+
+        Already-seen ids and back-dated events (older than the customer's latest) return [].
+        """
+        if txn.transaction_id in self._seen or txn.ts is None:
+            return []
+        window = self._windows.get(txn.customer_id)
+        if window is None:
+            window = self._windows[txn.customer_id] = _Window()
+        elif txn.ts < window.last_ts:
+            return []
+        else:
+            self._windows.move_to_end(txn.customer_id)
+        self._expire(window, txn.ts)
+
+        place_id = self._place_id(txn.place)
+        is_credit = 1 if txn.direction == "C" else 0
+        hits = self._evaluate(window, txn, place_id) if evaluate else []
+
+        self._seen.discard(window.push(txn.transaction_id, txn.ts, txn.amount, place_id, is_credit, self.max_events))
+        self._seen.add(txn.transaction_id)
+        if self._clock is None or txn.ts > self._clock:
+            self._clock = txn.ts
+        self._drop_idle()
+        return hits
+
+    def _evaluate(self, w, txn, place_id):
+        hits = []
+        if not len(w):
+            return hits
+
+        if txn.ts == w.last_ts and (w.second_places - {place_id}):
+            other = self._place_names[next(iter(w.second_places - {place_id}))]
+            hits.append(hit("SAME-TIME COLLISION",
+                            f"Same second in {other} and {txn.place}.",
+                            when=txn.when, places=[other, txn.place]))
+
+        # VELOCITY: advance the pointer past events 60s or more before this one
+        while w.velocity_seq < w.next_seq and w.ts[w.velocity_seq & w.mask] <= txn.ts - VELOCITY_WINDOW_S:
+            w.velocity_seq += 1
+        recent = w.next_seq - w.velocity_seq
+        if recent:
+            hits.append(hit("VELOCITY",
+                            f"{recent + 1} transactions detected in {VELOCITY_WINDOW_S} seconds.",
+                            other_transaction_ids=[w.tids[s & w.mask] for s in range(w.velocity_seq, w.next_seq)]))
+
+        if w.micro_count and txn.amount > MICRO_PROBE_FOLLOW_MIN:
+            i = w.latest(lambda i: w.amount[i] < MICRO_PROBE_MAX)
+            hits.append(hit("MICRO-PROBING",
+                            f"Small transaction of {w.amount[i]} followed by large transaction of {txn.amount}",
+                            probe_transaction_id=w.tids[i], gap_s=int(txn.ts - w.ts[i]),
+                            probe_amount=w.amount[i], amount=txn.amount))
+
+        if txn.direction == "D" and txn.amount > 0 and w.credit_buckets:
+            bucket = _amount_bucket(txn.amount)
+            if any(b in w.credit_buckets for b in range(bucket - 1, bucket + 3)):
+                i = w.latest(lambda i: w.credit[i] and w.amount[i] > 0
+                             and abs(txn.amount - w.amount[i]) <= PASS_THROUGH_TOLERANCE * w.amount[i])
+                if i is not None:
+                    gap = int(txn.ts - w.ts[i])
+                    hits.append(hit("PASS-THROUGH",
+                                    f"Debit of {txn.amount} {gap // 60} mins after credit of {w.amount[i]}.",
+                                    credit_transaction_id=w.tids[i], gap_s=gap,
+                                    credit_amount=w.amount[i], debit_amount=txn.amount))
+        return hits
+
+    def warm_from_db(self, conn, exclude_status="Pending"):
+        """Loads the last window of already-decided transactions so rules see recent history after a restart."""
+        rows = conn.execute("""
+            SELECT transaction_id, customer_id,
+                   CAST(STRFTIME('%s', transaction_date_time) AS INTEGER),
+                   transaction_date_time, transaction_place, transaction_country, amount,
+                   transaction_category, transaction_type
+            FROM Transactions
+            WHERE transaction_date_time >= DATETIME('now', ?)
+              AND transaction_status != ?
+            ORDER BY transaction_date_time, transaction_id
+        """, (f"-{int(self.window_s)} seconds", exclude_status)).fetchall()
+        for tid, cust, ts, when, place, country, amount, category, txn_type in rows:
+            self.process(Txn(tid, cust, ts, when, place, country, float(amount or 0),
+                             direction_of(category, txn_type)), evaluate=False)
+        return len(rows)